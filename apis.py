@@ -1,26 +1,55 @@
 import requests
 import json
 import logging
+from requests.adapters import HTTPAdapter
 from config import CIRCULO_CREDITO_API_KEY
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class CirculoCreditoAPI:
+    # Rutas de cada API relativas a base_url, indexadas por nombre de método
+    _ENDPOINTS = {
+        "verify_identity": "/sandbox/v3/identitydata/verification",
+        "verify_bank_account": "/sandbox/v3/bavs/accounts/verification",
+        "verify_employment": "/sandbox/v3/eva/employmentverifications/withPrivacyNotice",
+        "check_fraud": "/sandbox/v3/guardian/express",
+        "check_pld": "/sandbox/v3/pld/persons",
+        "get_fico_score": "/sandbox/v3/scores/fico/extended",
+        "get_fintech_score": "/sandbox/v3/scores/fintech",
+        "estimate_loan_amount": "/sandbox/v3/loanestimator/montoestimado",
+        "get_consolidated_report": "/sandbox/v3/rcc/consolidated/fico-pld"
+    }
+
     def __init__(self):
         self.base_url = "https://services.circulodecredito.com.mx"
+        self._urls = {name: self.base_url + path for name, path in self._ENDPOINTS.items()}
         self.headers = {
             "x-api-key": CIRCULO_CREDITO_API_KEY,
             "Content-Type": "application/json"
         }
 
-    def _make_request(self, endpoint, method='POST', data=None):
-        url = f"{self.base_url}{endpoint}"
+        # Sesión compartida: reutiliza conexiones TLS entre llamadas al mismo host
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+    def close(self):
+        """Libera las conexiones del pool"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _make_request(self, url, method='POST', data=None):
         try:
             if method == 'POST':
-                response = requests.post(url, headers=self.headers, json=data, timeout=30)
+                response = self.session.post(url, json=data, timeout=30)
             else:
-                response = requests.get(url, headers=self.headers, params=data, timeout=30)
+                response = self.session.get(url, params=data, timeout=30)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -33,7 +62,7 @@ class CirculoCreditoAPI:
             "curp": curp,
             "rfc": rfc
         }
-        return self._make_request("/sandbox/v3/identitydata/verification", data=data)
+        return self._make_request(self._urls["verify_identity"], data=data)
 
     def verify_bank_account(self, curp, cuenta_bancaria, banco="012"):
         """Verifica cuenta bancaria (BAVS)"""
@@ -42,7 +71,7 @@ class CirculoCreditoAPI:
             "bankAccount": cuenta_bancaria,
             "bankCode": banco
         }
-        return self._make_request("/sandbox/v3/bavs/accounts/verification", data=data)
+        return self._make_request(self._urls["verify_bank_account"], data=data)
 
     def verify_employment(self, curp, first_name, last_name, state="CDMX"):
         """Confirma empleo (EVA v3)"""
@@ -55,7 +84,7 @@ class CirculoCreditoAPI:
             "lastName": last_name,
             "curp": curp
         }
-        return self._make_request("/sandbox/v3/eva/employmentverifications/withPrivacyNotice", data=data)
+        return self._make_request(self._urls["verify_employment"], data=data)
 
     def check_fraud(self, curp, email=""):
         """Detección de fraude (Guardian Express)"""
@@ -63,7 +92,7 @@ class CirculoCreditoAPI:
             "curp": curp,
             "email": email
         }
-        return self._make_request("/sandbox/v3/guardian/express", data=data)
+        return self._make_request(self._urls["check_fraud"], data=data)
 
     def check_pld(self, first_name, last_name, curp):
         """Validación PLD (sanciones)"""
@@ -72,17 +101,17 @@ class CirculoCreditoAPI:
             "lastName": last_name,
             "curp": curp
         }
-        return self._make_request("/sandbox/v3/pld/persons", data=data)
+        return self._make_request(self._urls["check_pld"], data=data)
 
     def get_fico_score(self, curp):
         """Puntuación FICO extendida (300-850)"""
         data = {"curp": curp}
-        return self._make_request("/sandbox/v3/scores/fico/extended", data=data)
+        return self._make_request(self._urls["get_fico_score"], data=data)
 
     def get_fintech_score(self, curp):
         """Score fintech"""
         data = {"curp": curp}
-        return self._make_request("/sandbox/v3/scores/fintech", data=data)
+        return self._make_request(self._urls["get_fintech_score"], data=data)
 
     def estimate_loan_amount(self, curp, ingresos_mensuales, fico_score):
         """Estimación de monto de préstamo"""
@@ -91,12 +120,12 @@ class CirculoCreditoAPI:
             "curp": curp,
             "ficoscore": fico_score
         }
-        return self._make_request("/sandbox/v3/loanestimator/montoestimado", data=data)
+        return self._make_request(self._urls["estimate_loan_amount"], data=data)
 
     def get_consolidated_report(self, curp):
         """Reporte consolidado con FICO y PLD"""
         data = {"curp": curp}
-        return self._make_request("/sandbox/v3/rcc/consolidated/fico-pld", data=data)
+        return self._make_request(self._urls["get_consolidated_report"], data=data)
 
     # Legacy method names for compatibility
     def identity_data(self, curp, rfc, nombre):
@@ -3,20 +3,81 @@ Cliente HTTP Seguro para APIs de Círculo de Crédito
 Implementa autenticación ECDSA P-384 completa
 """
 
-import requests
+import functools
+import httpx
 import json
 import logging
+import orjson
+import time
+import urllib3
 from typing import Dict, Any, Optional
-from security_manager import CirculoCreditoSecurityManager
+from security_manager import CirculoCreditoSecurityManager, canonical_json
 
 logger = logging.getLogger(__name__)
 
+class CircuitBreaker:
+    """
+    Circuit breaker por cliente: tras fail_max fallos consecutivos del servicio
+    las llamadas fallan de inmediato durante reset_timeout segundos, en lugar de
+    esperar el timeout de cada una. Pasado ese tiempo se permite una llamada de
+    prueba; si vuelve a fallar, el circuito se abre de nuevo.
+    """
+
+    __slots__ = ('fail_max', 'reset_timeout', '_failures', '_opened_at')
+
+    def __init__(self, fail_max: int = 3, reset_timeout: float = 30.0):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+
+    def allow(self) -> bool:
+        """Indica si se puede realizar una llamada"""
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at >= self.reset_timeout:
+            # Semiabierto: pasa solo esta llamada de prueba. La espera se reinicia
+            # para que las llamadas concurrentes sigan rechazándose hasta que la
+            # prueba registre su resultado (si nunca lo hace, tras otro
+            # reset_timeout se permite una nueva prueba). Un fallo reabre el circuito
+            self._opened_at = now
+            self._failures = self.fail_max - 1
+            return True
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        if self._failures >= self.fail_max:
+            if self._opened_at is None:
+                logger.error(f"Circuito abierto tras {self._failures} fallos consecutivos")
+            self._opened_at = time.monotonic()
+
 class SecureCirculoCreditoAPI:
     """
     Cliente HTTP que implementa autenticación completa con firma ECDSA
     para todas las APIs de Círculo de Crédito
     """
 
+    __slots__ = ('api_key', 'security', 'base_url', '_urls', 'headers', 'session', '_sign_cached', '_breaker')
+
+    # Rutas de cada API relativas a base_url, indexadas por nombre de método
+    _ENDPOINTS = {
+        "verify_identity": "/sandbox/v3/identitydata/verification",
+        "verify_bank_account": "/sandbox/v3/bavs/accounts/verification",
+        "verify_employment": "/sandbox/v3/eva/employmentverifications/withPrivacyNotice",
+        "check_fraud": "/sandbox/v3/guardian/express",
+        "check_pld": "/sandbox/v3/pld/persons",
+        "get_fico_score": "/sandbox/v3/scores/fico/extended",
+        "get_fintech_score": "/sandbox/v3/scores/fintech",
+        "estimate_loan_amount": "/sandbox/v3/loanestimator/montoestimado",
+        "get_consolidated_report": "/sandbox/v3/rcc/consolidated/fico-pld"
+    }
+
     def __init__(self, api_key: str, security_manager: CirculoCreditoSecurityManager):
         """
         Inicializa el cliente seguro
@@ -28,87 +89,172 @@ class SecureCirculoCreditoAPI:
         self.api_key = api_key
         self.security = security_manager
         self.base_url = "https://services.circulodecredito.com.mx"
-        self.session = requests.Session()
+        self._urls = {name: self.base_url + path for name, path in self._ENDPOINTS.items()}
 
         # Configurar headers base
-        self.session.headers.update({
+        self.headers = {
             "x-api-key": self.api_key,
             "Content-Type": "application/json"
-        })
+        }
+        self.session = self._create_session()
+
+        # Cache de firmas por body serializado: la firma solo cubre el payload (no el
+        # endpoint), así que bodies idénticos como {"curp": ...} reutilizan la firma.
+        # La llave es el body completo y no un hash de 64 bits: una colisión devolvería
+        # la firma de otro payload. CPython guarda el hash de cada objeto bytes, así que
+        # la búsqueda no vuelve a recorrer el JSON. Body y firma son datos públicos, por
+        # lo que no se requiere comparación en tiempo constante (hmac.compare_digest)
+        self._sign_cached = functools.lru_cache(maxsize=128)(self.security.sign_bytes)
+
+        # Evita encadenar timeouts cuando Círculo de Crédito no responde
+        self._breaker = CircuitBreaker(fail_max=3, reset_timeout=30.0)
+
+        logger.info(f"{type(self).__name__} inicializado")
+
+    def _create_session(self):
+        """Crea el pool de conexiones keep-alive compartido por todas las requests"""
+        # Los errores de conexión se reintentan siempre; los 502/503/504 solo en métodos
+        # idempotentes, para no repetir una consulta POST que el servicio ya recibió
+        retries = urllib3.Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+        return urllib3.PoolManager(maxsize=16, headers=self.headers, retries=retries)
+
+    def warmup(self):
+        """
+        Abre por adelantado la conexión TCP+TLS con Círculo de Crédito
+
+        La conexión queda en el pool, así la primera request real no paga el
+        handshake. Los errores se ignoran: la request real reintentará conectar.
+        """
+        try:
+            self.session.request("HEAD", self.base_url + "/", timeout=5.0)
+        except urllib3.exceptions.HTTPError as e:
+            logger.debug("Precalentamiento de conexión fallido: %s", e)
+
+    def close(self):
+        """Libera las conexiones del pool"""
+        self.session.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _prepare_body(self, body: Optional[Dict[str, Any]]):
+        """
+        Firma el payload y lo serializa para el envío
+
+        Returns:
+            Tupla (headers adicionales, body JSON serializado o None)
+        """
+        headers = {}
+        json_body = None
+
+        if body:
+            # Serializar una sola vez: los bytes firmados son los mismos que se envían
+            json_body = canonical_json(body)
+            headers["x-signature"] = self._sign_cached(json_body)
+
+        return headers, json_body
+
+    def _process_response(self, method: str, url: str, status_code: int, headers, content: bytes) -> Dict[str, Any]:
+        """
+        Construye el resultado a partir de la respuesta HTTP y verifica su firma
+
+        Args:
+            status_code: Código HTTP de la respuesta
+            headers: Headers de la respuesta
+            content: Body crudo de la respuesta
+        """
+        signature_header = headers.get('x-signature', '')
+
+        result = {
+            "success": True,
+            "data": orjson.loads(content) if content else None,
+            "status_code": status_code,
+            "signature_verified": False
+        }
+
+        # Verificar firma de respuesta si está presente, directamente sobre los
+        # bytes recibidos
+        if signature_header and self.security.cdc_cert_available:
+            is_valid = self.security.verify_response(content, signature_header)
+            result["signature_verified"] = is_valid
+
+            if not is_valid:
+                logger.warning("Firma de respuesta inválida - posible suplantación")
+                result["warning"] = "Firma de respuesta no pudo ser verificada"
 
-        logger.info("SecureCirculoCreditoAPI inicializado")
+        logger.info(f"Request exitoso: {method} {url} -> {status_code}")
+        return result
 
-    def _make_signed_request(self, method: str, endpoint: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def _circuit_open_result(self, url: str) -> Dict[str, Any]:
+        """Resultado de error inmediato cuando el circuito está abierto"""
+        logger.warning(f"Circuito abierto, request omitida: {url}")
+        return {
+            "success": False,
+            "error": "Círculo de Crédito no disponible (circuito abierto)",
+            "status_code": None
+        }
+
+    def _make_signed_request(self, method: str, url: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Realiza una request firmada con autenticación ECDSA
 
         Args:
             method: Método HTTP (GET, POST, etc)
-            endpoint: Ruta del endpoint (ej: /sandbox/v3/eva/...)
+            url: URL completa del endpoint (ver _ENDPOINTS)
             body: Diccionario JSON a enviar (opcional)
 
         Returns:
             Response con validación de firma incluida
         """
-        url = f"{self.base_url}{endpoint}"
+        if not self._breaker.allow():
+            return self._circuit_open_result(url)
 
         # Preparar request
-        headers = {}
-        json_body = None
+        headers, json_body = self._prepare_body(body)
+        response = None
 
-        if body:
-            # Firmar el payload
-            signature = self.security.sign_request(body)
-            headers["x-signature"] = signature
-            json_body = json.dumps(body, separators=(',', ':'), sort_keys=True)
+        # El pool solo aplica sus headers base si la request no trae los suyos
+        headers = {**self.headers, **headers}
 
         try:
             # Enviar request
             if method.upper() == "POST":
-                response = self.session.post(url, data=json_body, headers=headers, timeout=30)
+                response = self.session.request("POST", url, body=json_body, headers=headers, timeout=30.0)
             elif method.upper() == "GET":
-                response = self.session.get(url, headers=headers, timeout=30)
+                response = self.session.request("GET", url, headers=headers, timeout=30.0)
             else:
                 raise ValueError(f"Método HTTP no soportado: {method}")
 
-            response.raise_for_status()
-
-            # Procesar respuesta
-            response_text = response.text
-            signature_header = response.headers.get('x-signature', '')
-
-            result = {
-                "success": True,
-                "data": response.json() if response_text else None,
-                "status_code": response.status_code,
-                "signature_verified": False
-            }
-
-            # Verificar firma de respuesta si está presente
-            if signature_header:
-                is_valid = self.security.verify_response(response_text, signature_header)
-                result["signature_verified"] = is_valid
+            # Un 4xx indica que el servicio responde; solo los 5xx cuentan como fallo
+            if response.status >= 500:
+                self._breaker.record_failure()
+            else:
+                self._breaker.record_success()
 
-                if not is_valid:
-                    logger.warning("Firma de respuesta inválida - posible suplantación")
-                    result["warning"] = "Firma de respuesta no pudo ser verificada"
+            if response.status >= 400:
+                logger.error(f"Error en request HTTP: {response.status} para {url}")
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status} para url: {url}",
+                    "status_code": response.status
+                }
 
-            logger.info(f"Request exitoso: {method} {endpoint} -> {response.status_code}")
-            return result
+            # Procesar respuesta
+            return self._process_response(method, url, response.status, response.headers, response.data)
 
-        except requests.exceptions.RequestException as e:
+        except urllib3.exceptions.HTTPError as e:
+            self._breaker.record_failure()
             logger.error(f"Error en request HTTP: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "status_code": getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
-            }
+            return {"success": False, "error": str(e), "status_code": None}
         except json.JSONDecodeError as e:
             logger.error(f"Error decodificando respuesta JSON: {e}")
             return {
                 "success": False,
                 "error": f"Respuesta JSON inválida: {e}",
-                "raw_response": response_text if 'response_text' in locals() else None
+                "raw_response": response.data.decode('utf-8', errors='replace') if response is not None else None
             }
         except Exception as e:
             logger.error(f"Error inesperado: {e}")
@@ -119,7 +265,7 @@ class SecureCirculoCreditoAPI:
     def verify_identity(self, curp: str, rfc: str) -> Dict[str, Any]:
         """Valida datos personales"""
         body = {"curp": curp, "rfc": rfc}
-        return self._make_signed_request("POST", "/sandbox/v3/identitydata/verification", body)
+        return self._make_signed_request("POST", self._urls["verify_identity"], body)
 
     def verify_bank_account(self, curp: str, account: str, bank_code: str = "012") -> Dict[str, Any]:
         """Verifica cuenta bancaria (BAVS)"""
@@ -128,7 +274,7 @@ class SecureCirculoCreditoAPI:
             "bankAccount": account,
             "bankCode": bank_code
         }
-        return self._make_signed_request("POST", "/sandbox/v3/bavs/accounts/verification", body)
+        return self._make_signed_request("POST", self._urls["verify_bank_account"], body)
 
     def verify_employment(self, curp: str, first_name: str, last_name: str, state: str = "CDMX") -> Dict[str, Any]:
         """Confirma empleo (EVA v3)"""
@@ -138,12 +284,12 @@ class SecureCirculoCreditoAPI:
             "lastName": last_name,
             "curp": curp
         }
-        return self._make_signed_request("POST", "/sandbox/v3/eva/employmentverifications/withPrivacyNotice", body)
+        return self._make_signed_request("POST", self._urls["verify_employment"], body)
 
     def check_fraud(self, curp: str, email: str = "") -> Dict[str, Any]:
         """Detección de fraude (Guardian Express)"""
         body = {"curp": curp, "email": email}
-        return self._make_signed_request("POST", "/sandbox/v3/guardian/express", body)
+        return self._make_signed_request("POST", self._urls["check_fraud"], body)
 
     def check_pld(self, first_name: str, last_name: str, curp: str) -> Dict[str, Any]:
         """Validación PLD (sanciones)"""
@@ -152,17 +298,17 @@ class SecureCirculoCreditoAPI:
             "lastName": last_name,
             "curp": curp
         }
-        return self._make_signed_request("POST", "/sandbox/v3/pld/persons", body)
+        return self._make_signed_request("POST", self._urls["check_pld"], body)
 
     def get_fico_score(self, curp: str) -> Dict[str, Any]:
         """Puntuación FICO extendida (300-850)"""
         body = {"curp": curp}
-        return self._make_signed_request("POST", "/sandbox/v3/scores/fico/extended", body)
+        return self._make_signed_request("POST", self._urls["get_fico_score"], body)
 
     def get_fintech_score(self, curp: str) -> Dict[str, Any]:
         """Score fintech"""
         body = {"curp": curp}
-        return self._make_signed_request("POST", "/sandbox/v3/scores/fintech", body)
+        return self._make_signed_request("POST", self._urls["get_fintech_score"], body)
 
     def estimate_loan_amount(self, curp: str, income: float, fico_score: int) -> Dict[str, Any]:
         """Estimación de monto de préstamo"""
@@ -171,9 +317,109 @@ class SecureCirculoCreditoAPI:
             "curp": curp,
             "ficoscore": fico_score
         }
-        return self._make_signed_request("POST", "/sandbox/v3/loanestimator/montoestimado", body)
+        return self._make_signed_request("POST", self._urls["estimate_loan_amount"], body)
 
     def get_consolidated_report(self, curp: str) -> Dict[str, Any]:
         """Reporte consolidado con FICO y PLD"""
         body = {"curp": curp}
-        return self._make_signed_request("POST", "/sandbox/v3/rcc/consolidated/fico-pld", body)
\ No newline at end of file
+        return self._make_signed_request("POST", self._urls["get_consolidated_report"], body)
+
+
+class AsyncSecureCirculoCreditoAPI(SecureCirculoCreditoAPI):
+    """
+    Variante asíncrona de SecureCirculoCreditoAPI sobre httpx.AsyncClient.
+
+    Todas las requests en vuelo comparten una conexión HTTP/2. Los métodos de
+    API heredados devuelven corrutinas, por lo que deben usarse con await.
+    """
+
+    __slots__ = ()
+
+    def _create_session(self):
+        """Crea el cliente HTTP/2 asíncrono compartido por todas las requests"""
+        # httpx solo reintenta errores de conexión, nunca una request ya enviada
+        transport = httpx.AsyncHTTPTransport(http2=True, retries=2)
+        return httpx.AsyncClient(transport=transport, headers=self.headers, timeout=30)
+
+    async def warmup(self):
+        """Abre por adelantado la conexión HTTP/2 con Círculo de Crédito (ver SecureCirculoCreditoAPI.warmup)"""
+        try:
+            await self.session.head(self.base_url + "/", timeout=5)
+        except httpx.HTTPError as e:
+            logger.debug("Precalentamiento de conexión fallido: %s", e)
+
+    def close(self):
+        """No aplica: httpx.AsyncClient se cierra de forma asíncrona"""
+        raise TypeError(f"{type(self).__name__} se cierra con 'await aclose()'")
+
+    def __enter__(self):
+        raise TypeError(f"{type(self).__name__} se usa con 'async with', no con 'with'")
+
+    async def aclose(self):
+        """Cierra las conexiones del cliente"""
+        await self.session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def _make_signed_request(self, method: str, url: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Realiza una request firmada con autenticación ECDSA (asíncrona)
+
+        Args:
+            method: Método HTTP (GET, POST, etc)
+            url: URL completa del endpoint (ver _ENDPOINTS)
+            body: Diccionario JSON a enviar (opcional)
+
+        Returns:
+            Response con validación de firma incluida
+        """
+        if not self._breaker.allow():
+            return self._circuit_open_result(url)
+
+        # Preparar request
+        headers, json_body = self._prepare_body(body)
+        response = None
+
+        try:
+            # Enviar request
+            if method.upper() == "POST":
+                response = await self.session.post(url, content=json_body, headers=headers)
+            elif method.upper() == "GET":
+                response = await self.session.get(url, headers=headers)
+            else:
+                raise ValueError(f"Método HTTP no soportado: {method}")
+
+            # Un 4xx indica que el servicio responde; solo los 5xx cuentan como fallo
+            if response.status_code >= 500:
+                self._breaker.record_failure()
+            else:
+                self._breaker.record_success()
+
+            response.raise_for_status()
+
+            # Procesar respuesta
+            return self._process_response(method, url, response.status_code, response.headers, response.content)
+
+        except httpx.HTTPError as e:
+            if not isinstance(e, httpx.HTTPStatusError):
+                self._breaker.record_failure()
+            logger.error(f"Error en request HTTP: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "status_code": e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            }
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decodificando respuesta JSON: {e}")
+            return {
+                "success": False,
+                "error": f"Respuesta JSON inválida: {e}",
+                "raw_response": response.text if response is not None else None
+            }
+        except Exception as e:
+            logger.error(f"Error inesperado: {e}")
+            return {"success": False, "error": f"Error interno: {e}"}
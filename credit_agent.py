@@ -1,16 +1,33 @@
+import asyncio
 import json
 import uuid
 import logging
 from datetime import datetime
-from apis_secure import SecureCirculoCreditoAPI
+from apis_secure import AsyncSecureCirculoCreditoAPI
 from security_manager import CirculoCreditoSecurityManager
-from anthropic import Anthropic
 from config import ANTHROPIC_API_KEY, CIRCULO_CREDITO_API_KEY, PRIVATE_KEY_PATH, CDC_CERT_PATH, validate_security_files
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _get(resp, key, default):
+    """Extrae data[key] de una respuesta de API, o default si falló o no trae data"""
+    data = resp.get('data') if resp.get('success') else None
+    return default if data is None else data.get(key, default)
+
+def _data(resp, default):
+    """Devuelve data de una respuesta de API, o default si falló o no trae data"""
+    data = resp.get('data') if resp.get('success') else None
+    return default if data is None else data
+
 class CreditEvaluationAgent:
+    # Campos de la solicitud que usa el flujo de evaluación
+    _CAMPOS_REQUERIDOS = ('curp', 'nombre', 'rfc', 'cuenta_bancaria', 'ingresos_mensuales', 'monto_solicitado', 'plazo_meses')
+
+    # Requests simultáneas de un lote: por debajo del límite de conexiones de httpx
+    # (100), así ninguna request espera en cola hasta el PoolTimeout
+    _MAX_CONCURRENTES = 32
+
     def __init__(self):
         # Validar archivos de seguridad
         validate_security_files()
@@ -22,36 +39,51 @@ class CreditEvaluationAgent:
         )
 
         # Inicializar API segura
-        self.api = SecureCirculoCreditoAPI(
+        self.api = AsyncSecureCirculoCreditoAPI(
             api_key=CIRCULO_CREDITO_API_KEY,
             security_manager=self.security_manager
         )
 
-        self.claude = Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
+        # El SDK de Anthropic solo se importa si hay API key configurada
+        self.claude = None
+        if ANTHROPIC_API_KEY:
+            from anthropic import Anthropic
+            self.claude = Anthropic(api_key=ANTHROPIC_API_KEY)
+
+    async def warmup(self):
+        """
+        Establece la conexión con Círculo de Crédito antes de recibir solicitudes,
+        sacando el handshake DNS+TLS del camino crítico de la primera evaluación
+        """
+        await self.api.warmup()
 
-    def evaluate_credit_request(self, solicitud):
+    async def aclose(self):
+        """Libera las conexiones del cliente de APIs"""
+        await self.api.aclose()
+
+    async def evaluate_credit_request(self, solicitud):
         """Evalúa una solicitud de crédito siguiendo el flujo definido"""
-        solicitud_id = f"CRED-{datetime.now().year}-{uuid.uuid4().hex[:5].upper()}"
+        solicitud_id = self._generar_id('CRED')
 
         logger.info(f"Iniciando evaluación {solicitud_id}")
 
         # FASE 1: VALIDACIÓN
-        fase1 = self._fase_validacion(solicitud)
+        fase1 = await self._fase_validacion(solicitud)
         if fase1['estado'] == 'RECHAZADO':
             return self._build_response(solicitud_id, 'RECHAZADO', 1, fase1, None, None, None, None)
 
         # FASE 2: COMPLIANCE
-        fase2 = self._fase_compliance(solicitud)
+        fase2 = await self._fase_compliance(solicitud)
         if fase2['estado'] == 'RECHAZADO':
             return self._build_response(solicitud_id, 'RECHAZADO', 2, fase1, fase2, None, None, None)
 
         # FASE 3: ANÁLISIS CREDITICIO
-        fase3 = self._fase_crediticio(solicitud)
+        fase3 = await self._fase_crediticio(solicitud)
         if fase3['fico_score'] < 550:
             return self._build_response(solicitud_id, 'RECHAZADO', 3, fase1, fase2, fase3, None, None)
 
         # FASE 4: CÁLCULO DE MONTO
-        fase4 = self._fase_monto(solicitud, fase3['fico_score'])
+        fase4 = await self._fase_monto(solicitud, fase3['fico_score'])
 
         # FASE 5: DECISIÓN FINAL
         fase5 = self._fase_decision(solicitud, fase3, fase4)
@@ -60,56 +92,156 @@ class CreditEvaluationAgent:
 
         return self._build_response(solicitud_id, estado_final, 5, fase1, fase2, fase3, fase4, fase5)
 
-    def _fase_validacion(self, solicitud):
-        """Fase 1: Validación inicial"""
-        # Parse names
-        names = solicitud['nombre'].split()
+    async def evaluate_batch(self, solicitudes):
+        """
+        Evalúa un lote de solicitudes con el mismo flujo que evaluate_credit_request.
+
+        Cada fase lanza sus endpoints para todas las solicitudes aún activas en una
+        sola ronda concurrente, así el lote tarda ~una ronda de RTT por fase en lugar
+        de una evaluación completa por solicitud. Como máximo _MAX_CONCURRENTES
+        requests están en vuelo a la vez. Las solicitudes a las que les falta algún
+        campo requerido se devuelven como error sin consultar ninguna API. Los
+        resultados conservan el orden.
+        """
+        n = len(solicitudes)
+        ids = [self._generar_id('CRED') for _ in range(n)]
+        resultados = [None] * n
+
+        logger.info(f"Iniciando evaluación de lote con {n} solicitudes")
+
+        # Una fila incompleta se rechaza sola, sin interrumpir el resto del lote
+        for i, solicitud in enumerate(solicitudes):
+            faltantes = [campo for campo in self._CAMPOS_REQUERIDOS if solicitud.get(campo) is None]
+            if faltantes:
+                logger.warning(f"Solicitud {ids[i]} incompleta, faltan: {', '.join(faltantes)}")
+                resultados[i] = self._build_error_response(ids[i], faltantes)
+        activos = [i for i in range(n) if resultados[i] is None]
+
+        curps = {i: solicitudes[i]['curp'] for i in activos}
+        nombres = {i: self._separar_nombre(solicitudes[i]['nombre']) for i in activos}
+
+        # La corrutina de cada llamada se crea hasta obtener un lugar en el semáforo
+        limite = asyncio.Semaphore(self._MAX_CONCURRENTES)
+
+        async def limitado(llamada, *args):
+            async with limite:
+                return await llamada(*args)
+
+        # FASE 1: VALIDACIÓN
+        identities, banks, employments = await asyncio.gather(
+            asyncio.gather(*[limitado(self.api.verify_identity, curps[i], solicitudes[i]['rfc']) for i in activos]),
+            asyncio.gather(*[limitado(self.api.verify_bank_account, curps[i], solicitudes[i]['cuenta_bancaria'], solicitudes[i].get('banco', '012')) for i in activos]),
+            asyncio.gather(*[limitado(self.api.verify_employment, curps[i], *nombres[i], solicitudes[i].get('estado', 'CDMX')) for i in activos])
+        )
+        fase1 = {i: self._evaluar_validacion(*r) for i, r in zip(activos, zip(identities, banks, employments))}
+        for i in activos:
+            if fase1[i]['estado'] == 'RECHAZADO':
+                resultados[i] = self._build_response(ids[i], 'RECHAZADO', 1, fase1[i], None, None, None, None)
+        activos = [i for i in activos if resultados[i] is None]
+
+        # FASE 2: COMPLIANCE
+        guardians, plds = await asyncio.gather(
+            asyncio.gather(*[limitado(self.api.check_fraud, curps[i], solicitudes[i].get('email', '')) for i in activos]),
+            asyncio.gather(*[limitado(self.api.check_pld, *nombres[i], curps[i]) for i in activos])
+        )
+        fase2 = {i: self._evaluar_compliance(*r) for i, r in zip(activos, zip(guardians, plds))}
+        for i in activos:
+            if fase2[i]['estado'] == 'RECHAZADO':
+                resultados[i] = self._build_response(ids[i], 'RECHAZADO', 2, fase1[i], fase2[i], None, None, None)
+        activos = [i for i in activos if resultados[i] is None]
+
+        # FASE 3: ANÁLISIS CREDITICIO
+        ficos, fintechs, reportes = await asyncio.gather(
+            asyncio.gather(*[limitado(self.api.get_fico_score, curps[i]) for i in activos]),
+            asyncio.gather(*[limitado(self.api.get_fintech_score, curps[i]) for i in activos]),
+            asyncio.gather(*[limitado(self.api.get_consolidated_report, curps[i]) for i in activos])
+        )
+        fase3 = {i: self._evaluar_crediticio(*r) for i, r in zip(activos, zip(ficos, fintechs, reportes))}
+        for i in activos:
+            if fase3[i]['fico_score'] < 550:
+                resultados[i] = self._build_response(ids[i], 'RECHAZADO', 3, fase1[i], fase2[i], fase3[i], None, None)
+        activos = [i for i in activos if resultados[i] is None]
+
+        # FASE 4: CÁLCULO DE MONTO
+        estimators = await asyncio.gather(*[
+            limitado(self.api.estimate_loan_amount, curps[i], solicitudes[i]['ingresos_mensuales'], fase3[i]['fico_score'])
+            for i in activos
+        ])
+
+        # FASE 5: DECISIÓN FINAL
+        for i, estimator in zip(activos, estimators):
+            fase4 = self._evaluar_monto(estimator)
+            fase5 = self._fase_decision(solicitudes[i], fase3[i], fase4)
+            estado_final = self._determinar_estado_final(fase3[i], fase4, solicitudes[i])
+            resultados[i] = self._build_response(ids[i], estado_final, 5, fase1[i], fase2[i], fase3[i], fase4, fase5)
+
+        return resultados
+
+    def _generar_id(self, prefijo):
+        return f"{prefijo}-{datetime.now().year}-{uuid.uuid4().hex[:5].upper()}"
+
+    def _separar_nombre(self, nombre):
+        """Devuelve (first_name, last_name) a partir del nombre completo"""
+        names = nombre.split()
         first_name = names[0] if names else ""
         last_name = names[-1] if len(names) > 1 else ""
+        return first_name, last_name
 
-        identity = self.api.verify_identity(solicitud['curp'], solicitud['rfc'])
-        bank = self.api.verify_bank_account(solicitud['curp'], solicitud['cuenta_bancaria'], solicitud.get('banco', '012'))
-        employment = self.api.verify_employment(solicitud['curp'], first_name, last_name, solicitud.get('estado', 'CDMX'))
+    async def _fase_validacion(self, solicitud):
+        """Fase 1: Validación inicial"""
+        first_name, last_name = self._separar_nombre(solicitud['nombre'])
 
-        validado = all([
-            identity.get('success', False),
-            bank.get('success', False),
-            employment.get('success', False)
-        ])
+        identity, bank, employment = await asyncio.gather(
+            self.api.verify_identity(solicitud['curp'], solicitud['rfc']),
+            self.api.verify_bank_account(solicitud['curp'], solicitud['cuenta_bancaria'], solicitud.get('banco', '012')),
+            self.api.verify_employment(solicitud['curp'], first_name, last_name, solicitud.get('estado', 'CDMX'))
+        )
+        return self._evaluar_validacion(identity, bank, employment)
+
+    def _evaluar_validacion(self, identity, bank, employment):
+        # Las llamadas ya se hicieron en paralelo; la revisión corta en el primer fallo
+        # empezando por identidad, la validación más restrictiva
+        validado = identity.get('success', False) and bank.get('success', False) and employment.get('success', False)
 
         return {
             'estado': 'PASADA' if validado else 'RECHAZADO',
-            'identity_data': identity.get('data', {'validado': False}) if identity.get('success') else {'validado': False},
-            'bank_verification': bank.get('data', {'validado': False}) if bank.get('success') else {'validado': False},
-            'employment_verification': employment.get('data', {'validado': False}) if employment.get('success') else {'validado': False}
+            'identity_data': _data(identity, {'validado': False}),
+            'bank_verification': _data(bank, {'validado': False}),
+            'employment_verification': _data(employment, {'validado': False})
         }
 
-    def _fase_compliance(self, solicitud):
+    async def _fase_compliance(self, solicitud):
         """Fase 2: Compliance y anti-fraude"""
-        names = solicitud['nombre'].split()
-        first_name = names[0] if names else ""
-        last_name = names[-1] if len(names) > 1 else ""
+        first_name, last_name = self._separar_nombre(solicitud['nombre'])
 
-        guardian = self.api.check_fraud(solicitud['curp'], solicitud.get('email', ''))
-        pld = self.api.check_pld(first_name, last_name, solicitud['curp'])
+        guardian, pld = await asyncio.gather(
+            self.api.check_fraud(solicitud['curp'], solicitud.get('email', '')),
+            self.api.check_pld(first_name, last_name, solicitud['curp'])
+        )
+        return self._evaluar_compliance(guardian, pld)
 
-        aprobado = (guardian.get('success', False) and not guardian.get('data', {}).get('fraude_detectado', False)) and \
-                  (pld.get('success', False) and not pld.get('data', {}).get('en_lista', False))
+    def _evaluar_compliance(self, guardian, pld):
+        aprobado = (guardian.get('success', False) and not _get(guardian, 'fraude_detectado', False)) and \
+                  (pld.get('success', False) and not _get(pld, 'en_lista', False))
 
         return {
             'estado': 'APROBADO' if aprobado else 'RECHAZADO',
-            'fraude_detectado': guardian.get('data', {}).get('fraude_detectado', False) if guardian.get('success') else False,
-            'pld_check': pld.get('data', {'en_lista': False}) if pld.get('success') else {'en_lista': False}
+            'fraude_detectado': _get(guardian, 'fraude_detectado', False),
+            'pld_check': _data(pld, {'en_lista': False})
         }
 
-    def _fase_crediticio(self, solicitud):
+    async def _fase_crediticio(self, solicitud):
         """Fase 3: Análisis crediticio"""
-        fico = self.api.get_fico_score(solicitud['curp'])
-        fintech = self.api.get_fintech_score(solicitud['curp'])
-        reporte = self.api.get_consolidated_report(solicitud['curp'])
+        fico, fintech, reporte = await asyncio.gather(
+            self.api.get_fico_score(solicitud['curp']),
+            self.api.get_fintech_score(solicitud['curp']),
+            self.api.get_consolidated_report(solicitud['curp'])
+        )
+        return self._evaluar_crediticio(fico, fintech, reporte)
 
-        fico_score = fico.get('data', {}).get('score', 0) if fico.get('success') else 0
-        fintech_score = fintech.get('data', {}).get('score', 0) if fintech.get('success') else 0
+    def _evaluar_crediticio(self, fico, fintech, reporte):
+        fico_score = _get(fico, 'score', 0)
+        fintech_score = _get(fintech, 'score', 0)
 
         categoria = self._categorizar_riesgo(fico_score)
 
@@ -117,27 +249,27 @@ class CreditEvaluationAgent:
             'fico_score': fico_score,
             'fintech_score': fintech_score,
             'categoria_riesgo': categoria,
-            'historial_creditos': reporte.get('data', {}).get('creditos', 0) if reporte.get('success') else 0,
-            'deudas_activas': reporte.get('data', {}).get('deudas', 0) if reporte.get('success') else 0,
-            'dti': reporte.get('data', {}).get('dti', 0.0) if reporte.get('success') else 0.0
+            'historial_creditos': _get(reporte, 'creditos', 0),
+            'deudas_activas': _get(reporte, 'deudas', 0),
+            'dti': _get(reporte, 'dti', 0.0)
         }
 
-    def _fase_monto(self, solicitud, fico_score):
+    async def _fase_monto(self, solicitud, fico_score):
         """Fase 4: Cálculo de monto"""
-        estimator = self.api.estimate_loan_amount(solicitud['curp'], solicitud['ingresos_mensuales'], fico_score)
+        estimator = await self.api.estimate_loan_amount(solicitud['curp'], solicitud['ingresos_mensuales'], fico_score)
+        return self._evaluar_monto(estimator)
 
+    def _evaluar_monto(self, estimator):
         return {
-            'monto_maximo': estimator.get('data', {}).get('monto_maximo', 0) if estimator.get('success') else 0,
-            'tasa_sugerida': estimator.get('data', {}).get('tasa_sugerida', '0%') if estimator.get('success') else '0%',
-            'plazo_recomendado': estimator.get('data', {}).get('plazo_recomendado', 12) if estimator.get('success') else 12
+            'monto_maximo': _get(estimator, 'monto_maximo', 0),
+            'tasa_sugerida': _get(estimator, 'tasa_sugerida', '0%'),
+            'plazo_recomendado': _get(estimator, 'plazo_recomendado', 12)
         }
 
     def _fase_decision(self, solicitud, fase3, fase4):
         """Fase 5: Decisión final"""
-        reporte = self.api.get_consolidated_report(solicitud['curp'])
-
         return {
-            'reporte_id': f"REP-{datetime.now().year}-{uuid.uuid4().hex[:5].upper()}",
+            'reporte_id': self._generar_id('REP'),
             'recomendacion_final': 'APROBADO',  # Will be determined in _determinar_estado_final
             'motivo': 'Evaluación completada',
             'condiciones': {
@@ -189,6 +321,15 @@ class CreditEvaluationAgent:
         }
         return response
 
+    def _build_error_response(self, solicitud_id, campos_faltantes):
+        """Resultado de una solicitud del lote que no se pudo evaluar por datos incompletos"""
+        return {
+            'solicitud_id': solicitud_id,
+            'estado_general': 'ERROR',
+            'error': 'Campos requeridos faltantes',
+            'campos': campos_faltantes
+        }
+
     def _generar_resumen(self, estado, f3, f4, f5):
         if estado == 'APROBADO':
             return f"Solicitante aprobado. FICO {f3['fico_score'] if f3 else 0}, monto máximo {f4['monto_maximo'] if f4 else 0}."
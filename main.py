@@ -4,48 +4,60 @@ Agente IA para Evaluación Crediticia - Círculo de Crédito
 Plataforma automática de otorgamiento de créditos
 """
 
-import json
+import asyncio
 import sys
 import logging
-from credit_agent import CreditEvaluationAgent
+from pathlib import Path
+import orjson
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def emitir(data, option=0):
+    """Escribe un objeto como JSON (UTF-8) en stdout"""
+    sys.stdout.buffer.write(orjson.dumps(data, option=option | orjson.OPT_APPEND_NEWLINE))
+    sys.stdout.flush()
+
+async def evaluar(agent, solicitud):
+    """Ejecuta la evaluación y libera las conexiones del agente al terminar"""
+    try:
+        return await agent.evaluate_credit_request(solicitud)
+    finally:
+        await agent.aclose()
+
 def main():
     """Función principal del agente"""
     try:
         # Leer datos de entrada desde stdin o archivo
         if len(sys.argv) > 1:
             # Leer desde archivo
-            with open(sys.argv[1], 'r', encoding='utf-8') as f:
-                solicitud = json.load(f)
+            solicitud = orjson.loads(Path(sys.argv[1]).read_bytes())
         else:
             # Leer desde stdin
-            input_data = sys.stdin.read()
-            solicitud = json.loads(input_data)
+            solicitud = orjson.loads(sys.stdin.buffer.read())
 
         logging.info("Solicitud recibida: %s", solicitud.get('nombre', 'Desconocido'))
 
-        # Inicializar agente
+        # Inicializar agente (el import se difiere hasta tener una solicitud válida)
+        from credit_agent import CreditEvaluationAgent
         agent = CreditEvaluationAgent()
 
         # Procesar evaluación
-        resultado = agent.evaluate_credit_request(solicitud)
+        resultado = asyncio.run(evaluar(agent, solicitud))
 
         # Imprimir resultado como JSON
-        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        emitir(resultado, orjson.OPT_INDENT_2)
 
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logging.error("Error al parsear JSON de entrada: %s", e)
-        print(json.dumps({"error": "JSON inválido", "detalle": str(e)}))
+        emitir({"error": "JSON inválido", "detalle": str(e)})
         sys.exit(1)
     except KeyError as e:
         logging.error("Campo requerido faltante: %s", e)
-        print(json.dumps({"error": "Campo requerido faltante", "campo": str(e)}))
+        emitir({"error": "Campo requerido faltante", "campo": str(e)})
         sys.exit(1)
     except Exception as e:
         logging.error("Error inesperado: %s", e)
-        print(json.dumps({"error": "Error interno", "detalle": str(e)}))
+        emitir({"error": "Error interno", "detalle": str(e)})
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -4,11 +4,11 @@ Implementa firma digital ECDSA P-384 según especificaciones de Círculo de Cré
 """
 
 import hashlib
-import json
-import base64
 import logging
+from base64 import b64decode, b64encode
+import orjson
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import serialization
@@ -17,12 +17,26 @@ from cryptography.exceptions import InvalidSignature
 
 logger = logging.getLogger(__name__)
 
+def canonical_json(payload: Dict[str, Any]) -> bytes:
+    """
+    Normaliza un payload JSON (keys ordenadas, sin espacios) a bytes UTF-8
+
+    Es la representación que se firma y se envía como body de la request.
+    """
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+
 class CirculoCreditoSecurityManager:
     """
     Gestor de seguridad que maneja la autenticación ECDSA P-384
     para requests a Círculo de Crédito
     """
 
+    # Se instancia una vez por proceso y se consulta en cada request
+    __slots__ = (
+        'private_key_path', 'cdc_cert_path', 'signing_key', 'verifying_key',
+        'cdc_cert_available', '_sha384', '_algo'
+    )
+
     def __init__(self, private_key_path: str, cdc_cert_path: str):
         """
         Inicializa el gestor de seguridad con llaves ECDSA
@@ -40,6 +54,10 @@ class CirculoCreditoSecurityManager:
         if not self.cdc_cert_path.exists():
             raise FileNotFoundError(f"Certificado de Círculo no encontrado: {cdc_cert_path}")
 
+        # Algoritmo de firma reutilizable: el digest SHA-384 se calcula con hashlib
+        self._sha384 = hashes.SHA384()
+        self._algo = ec.ECDSA(utils.Prehashed(self._sha384))
+
         # Cargar llaves
         self._load_keys()
 
@@ -85,35 +103,41 @@ class CirculoCreditoSecurityManager:
         Returns:
             Firma en base64 para usar en header x-signature
         """
-        try:
-            # Normalizar JSON (ordenar keys, sin espacios extra)
-            json_payload = json.dumps(payload, separators=(',', ':'), sort_keys=True)
+        return self.sign_bytes(canonical_json(payload)).decode('ascii')
 
-            # Crear hash SHA-384 del payload
-            payload_bytes = json_payload.encode('utf-8')
+    def sign_bytes(self, payload_bytes: bytes) -> bytes:
+        """
+        Firma bytes ya serializados con la llave privada ECDSA P-384
 
-            # Firmar con ECDSA usando cryptography
-            signature = self.signing_key.sign(
-                payload_bytes,
-                ec.ECDSA(hashes.SHA384())
-            )
+        Permite firmar exactamente los mismos bytes que se envían en el body.
 
-            # Codificar en base64
-            signature_b64 = base64.b64encode(signature).decode('utf-8')
+        Args:
+            payload_bytes: JSON normalizado codificado en UTF-8
+
+        Returns:
+            Firma en base64 (bytes ASCII) para usar directamente en header x-signature
+        """
+        try:
+            # Crear hash SHA-384 del payload y firmar el digest con ECDSA
+            digest = hashlib.sha384(payload_bytes).digest()
+            signature = self.signing_key.sign(digest, self._algo)
+
+            # Codificar en base64; el cliente HTTP acepta el header como bytes
+            signature_b64 = b64encode(signature)
 
-            logger.debug(f"Payload firmado: {len(json_payload)} bytes -> {len(signature_b64)} chars b64")
+            logger.debug("Payload firmado: %d bytes -> %d chars b64", len(payload_bytes), len(signature_b64))
             return signature_b64
 
         except Exception as e:
             logger.error(f"Error firmando request: {e}")
             raise
 
-    def verify_response(self, response_body: str, signature_header: str) -> bool:
+    def verify_response(self, response_body: Union[str, bytes], signature_header: str) -> bool:
         """
         Verifica la firma de una respuesta de Círculo de Crédito
 
         Args:
-            response_body: Body de la respuesta (JSON string)
+            response_body: Body de la respuesta (JSON string o bytes crudos)
             signature_header: Valor del header x-signature
 
         Returns:
@@ -126,14 +150,14 @@ class CirculoCreditoSecurityManager:
 
         try:
             # Decodificar firma de base64
-            signature_bytes = base64.b64decode(signature_header)
+            signature_bytes = b64decode(signature_header)
 
-            # Verificar firma con certificado público de Círculo
-            self.verifying_key.verify(
-                signature_bytes,
-                response_body.encode('utf-8'),
-                ec.ECDSA(hashes.SHA384())
-            )
+            if isinstance(response_body, str):
+                response_body = response_body.encode('utf-8')
+
+            # Verificar el digest SHA-384 con certificado público de Círculo
+            digest = hashlib.sha384(response_body).digest()
+            self.verifying_key.verify(signature_bytes, digest, self._algo)
 
             logger.debug("Firma de respuesta verificada correctamente")
             return True
@@ -6,28 +6,89 @@ Genera certificados ECDSA P-384 y configura el entorno
 
 import os
 import sys
+import datetime
+import threading
 from pathlib import Path
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives import hashes
 import base64
+from secrets import randbits
+
+# Códigos de salida del script; 1 (excepción no atrapada) y 2 (error de uso de
+# argparse) los reserva el intérprete
+EXIT_OK = 0
+EXIT_MISSING_FILES = 3
+EXIT_CRYPTO_ERROR = 4
+EXIT_IO_ERROR = 5
+
+# Separador de la cabecera de salida
+_SEP = "=" * 60
+
+# Vigencia del certificado auto-firmado
+_ONE_YEAR = datetime.timedelta(days=365)
+
+# Contenido de security/INSTRUCCIONES.txt, codificado una sola vez
+_INSTRUCTIONS = """INSTRUCCIONES PARA CONFIGURAR CERTIFICADOS EN CIRCULO DE CREDITO
+
+1. Ve a: https://developer.circulodecredito.com.mx/user/apps
+2. Selecciona tu aplicacion: plataforma-creditos-ai
+3. Ve a la seccion: Certificados
+4. Sube el archivo: certificate.pem (generado automaticamente)
+5. Descarga el certificado de Circulo de Credito
+6. Guardalo como: cdc_cert.pem en esta carpeta
+7. El agente estara listo para funcionar!
+
+NOTA: El certificado generado es auto-firmado para testing.
+Para produccion, usa una Autoridad Certificadora reconocida.
+""".encode('utf-8')
+
+# Módulos de cryptography (bindings de OpenSSL) y constantes que dependen de
+# ellos; se cargan bajo demanda con _load_crypto()
+x509 = NameOID = serialization = ec = hashes = UnsupportedAlgorithm = None
+_CERT_SUBJECT = _SHA256 = _CURVE = None
+
+def _load_crypto():
+    """Importa cryptography y construye las constantes del certificado (una sola vez)"""
+    global x509, NameOID, serialization, ec, hashes, UnsupportedAlgorithm
+    global _CERT_SUBJECT, _SHA256, _CURVE
+    if _CURVE is not None:
+        return
 
-def create_self_signed_certificate(private_key, output_path):
-    """Crea un certificado auto-firmado simple (para demo)"""
     from cryptography import x509
     from cryptography.x509.oid import NameOID
-    import datetime
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.exceptions import UnsupportedAlgorithm
 
-    # Crear subject y issuer
-    subject = issuer = x509.Name([
+    # Subject/issuer del certificado auto-firmado, curva y hash: son invariantes
+    _CERT_SUBJECT = x509.Name([
         x509.NameAttribute(NameOID.COUNTRY_NAME, "MX"),
         x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "CDMX"),
         x509.NameAttribute(NameOID.LOCALITY_NAME, "Mexico"),
         x509.NameAttribute(NameOID.ORGANIZATION_NAME, "TuEmpresa"),
         x509.NameAttribute(NameOID.COMMON_NAME, "TuApp"),
     ])
+    _SHA256 = hashes.SHA256()
+    _CURVE = ec.SECP384R1()
+
+def create_self_signed_certificate(private_key, output_path, encoding=None):
+    """
+    Crea un certificado auto-firmado simple (para demo)
+
+    Args:
+        private_key: Llave privada ECDSA con la que se firma el certificado
+        output_path: Ruta donde se guarda el certificado
+        encoding: serialization.Encoding del archivo; por defecto PEM, que es lo
+            que pide el apihub. DER evita el paso base64 (p. ej. para pruebas)
+    """
+    _load_crypto()
+    if encoding is None:
+        encoding = serialization.Encoding.PEM
 
-    # Crear certificado
+    # Subject e issuer son el mismo nombre precalculado
+    subject = issuer = _CERT_SUBJECT
+
+    # Crear certificado (una sola lectura del reloj, en UTC explícito)
+    now = datetime.datetime.now(datetime.timezone.utc)
     cert = x509.CertificateBuilder().subject_name(
         subject
     ).issuer_name(
@@ -35,100 +96,177 @@ def create_self_signed_certificate(private_key, output_path):
     ).public_key(
         private_key.public_key()
     ).serial_number(
-        x509.random_serial_number()
+        # Serial aleatorio positivo de hasta 159 bits (máximo 20 bytes en RFC 5280)
+        (randbits(160) >> 1) | 1
     ).not_valid_before(
-        datetime.datetime.utcnow()
+        now
     ).not_valid_after(
-        datetime.datetime.utcnow() + datetime.timedelta(days=365)
-    ).sign(private_key, hashes.SHA256())
+        now + _ONE_YEAR
+    ).sign(private_key, _SHA256)
+
+    # Guardar certificado sin conservar referencias intermedias
+    Path(output_path).write_bytes(cert.public_bytes(encoding))
+    del cert
+
+def _flush(out):
+    """Escribe las líneas acumuladas en un solo write() y vacía el buffer"""
+    if out:
+        sys.stdout.write("\n".join(out) + "\n")
+        out.clear()
+
+def _existing_key_is_valid(pri_key_path, cert_path):
+    """
+    Indica si la llave privada y el certificado existen, se pueden cargar y
+    corresponden, y si la llave es ECDSA P-384 (la única que firma requests)
+    """
+    if not (pri_key_path.exists() and cert_path.exists()):
+        return False
+    try:
+        key = serialization.load_pem_private_key(pri_key_path.read_bytes(), password=None)
+        cert = x509.load_pem_x509_certificate(cert_path.read_bytes())
+    except (ValueError, TypeError):
+        return False
+    if not (isinstance(key, ec.EllipticCurvePrivateKey) and isinstance(key.curve, ec.SECP384R1)):
+        return False
+    # Un certificado de otra llave también obliga a regenerar
+    spki = serialization.PublicFormat.SubjectPublicKeyInfo
+    der = serialization.Encoding.DER
+    return cert.public_key().public_bytes(der, spki) == key.public_key().public_bytes(der, spki)
 
-    # Guardar certificado
-    with open(output_path, 'wb') as f:
-        f.write(cert.public_bytes(serialization.Encoding.PEM))
+def main(force=False):
+    """
+    Configuración completa de seguridad usando Python
 
-def main():
-    """Configuración completa de seguridad usando Python"""
-    print("[SEC] CONFIGURACION DE SEGURIDAD - CIRCULO DE CREDITO")
-    print("=" * 60)
+    Args:
+        force: Regenera llave y certificado aunque ya existan y sean válidos
+
+    Returns:
+        Código de salida (EXIT_OK si la configuración quedó completa)
+    """
+    # La salida se acumula y se escribe por fase, no línea por línea
+    _out = [
+        "[SEC] CONFIGURACION DE SEGURIDAD - CIRCULO DE CREDITO",
+        _SEP,
+    ]
 
     # Crear directorio de seguridad
     security_dir = Path("./security")
     security_dir.mkdir(exist_ok=True)
-    print(f"[DIR] Directorio de seguridad creado: {security_dir.absolute()}")
+    _out.append(f"[DIR] Directorio de seguridad creado: {security_dir.absolute()}")
+
+    pri_key_path = security_dir / "pri_key.pem"
+    cert_path = security_dir / "certificate.pem"
+    instructions_path = security_dir / "INSTRUCCIONES.txt"
 
     try:
+        _load_crypto()
+    except ImportError as e:
+        _out.append(f"\n[ERROR] cryptography no esta disponible: {e}")
+        _flush(_out)
+        return EXIT_CRYPTO_ERROR
+
+    try:
+        # Parámetros de serialización de la llave, resueltos una sola vez
+        _PEM = serialization.Encoding.PEM
+        _PKCS8 = serialization.PrivateFormat.PKCS8
+        _NoEnc = serialization.NoEncryption()
+
+        # Reejecuciones: si la llave existente es válida no se regenera nada
+        if not force and _existing_key_is_valid(pri_key_path, cert_path):
+            _out.append(f"[SKIP] Llave privada y certificado existentes en: {security_dir}")
+            _out.append("Usa --force para regenerarlos")
+            # No dejar la carpeta a medio configurar
+            if not instructions_path.exists():
+                instructions_path.write_bytes(_INSTRUCTIONS)
+                _out.append(f"[OK] Instrucciones guardadas en: {instructions_path}")
+            _flush(_out)
+            return EXIT_OK
+
         # Paso 1: Generar llave privada ECDSA P-384
-        print("\n[1/4] GENERANDO LLAVE PRIVADA ECDSA P-384")
-        private_key = ec.generate_private_key(ec.SECP384R1())
-        private_key_pem = private_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption()
-        ).decode('utf-8')
-
-        pri_key_path = security_dir / "pri_key.pem"
-        with open(pri_key_path, 'w') as f:
-            f.write(private_key_pem)
-        print(f"[OK] Llave privada guardada en: {pri_key_path}")
+        _out.append("\n[1/4] GENERANDO LLAVE PRIVADA ECDSA P-384")
+        _flush(_out)
+
+        # INSTRUCCIONES.txt se escribe en otro hilo mientras OpenSSL genera la
+        # llave (la generación libera el GIL); el error, si hay, se reporta en el paso 4
+        instructions_errors = []
+
+        def _write_instructions():
+            try:
+                instructions_path.write_bytes(_INSTRUCTIONS)
+            except OSError as exc:
+                instructions_errors.append(exc)
+
+        writer = threading.Thread(target=_write_instructions)
+        writer.start()
+        private_key = ec.generate_private_key(_CURVE)
+        writer.join()
+        pri_key_path.write_bytes(private_key.private_bytes(
+            encoding=_PEM,
+            format=_PKCS8,
+            encryption_algorithm=_NoEnc
+        ))
+        _out.append(f"[OK] Llave privada guardada en: {pri_key_path}")
 
         # Paso 2: Generar certificado público
-        print("\n[2/4] GENERANDO CERTIFICADO PUBLICO")
-        cert_path = security_dir / "certificate.pem"
+        _out.append("\n[2/4] GENERANDO CERTIFICADO PUBLICO")
+        _flush(_out)
         create_self_signed_certificate(private_key, cert_path)
-        print(f"[OK] Certificado guardado en: {cert_path}")
+        _out.append(f"[OK] Certificado guardado en: {cert_path}")
 
         # Paso 3: Mostrar información
-        print("\n[3/4] INFORMACION DE LAS LLAVES")
-        print("Llave privada generada correctamente")
-        print("Certificado auto-firmado creado (para testing)")
+        _out.append("\n[3/4] INFORMACION DE LAS LLAVES")
+        _out.append("Llave privada generada correctamente")
+        _out.append("Certificado auto-firmado creado (para testing)")
 
         # Paso 4: Crear archivo de instrucciones
-        print("\n[4/4] CREANDO ARCHIVO DE INSTRUCCIONES")
-        instructions_path = security_dir / "INSTRUCCIONES.txt"
-        with open(instructions_path, 'w', encoding='utf-8') as f:
-            f.write("""INSTRUCCIONES PARA CONFIGURAR CERTIFICADOS EN CIRCULO DE CREDITO
+        _out.append("\n[4/4] CREANDO ARCHIVO DE INSTRUCCIONES")
+        if instructions_errors:
+            raise instructions_errors[0]
 
-1. Ve a: https://developer.circulodecredito.com.mx/user/apps
-2. Selecciona tu aplicacion: plataforma-creditos-ai
-3. Ve a la seccion: Certificados
-4. Sube el archivo: certificate.pem (generado automaticamente)
-5. Descarga el certificado de Circulo de Credito
-6. Guardalo como: cdc_cert.pem en esta carpeta
-7. El agente estara listo para funcionar!
-
-NOTA: El certificado generado es auto-firmado para testing.
-Para produccion, usa una Autoridad Certificadora reconocida.
-""")
-
-        print(f"[OK] Instrucciones guardadas en: {instructions_path}")
+        _out.append(f"[OK] Instrucciones guardadas en: {instructions_path}")
+        _flush(_out)
 
-        # Verificar archivos generados
-        pri_key = security_dir / "pri_key.pem"
-        cert = security_dir / "certificate.pem"
-        instructions = security_dir / "INSTRUCCIONES.txt"
+        # Verificar archivos generados con una sola lectura del directorio
+        present = {entry.name for entry in os.scandir(security_dir)}
+        pri_ok = pri_key_path.name in present
+        cert_ok = cert_path.name in present
+        instructions_ok = instructions_path.name in present
 
-        print("\n[INFO] ARCHIVOS GENERADOS:")
-        print(f"[KEY] Llave privada: {pri_key} {'[OK]' if pri_key.exists() else '[FAIL]'}")
-        print(f"[CERT] Certificado: {cert} {'[OK]' if cert.exists() else '[FAIL]'}")
-        print(f"[TXT] Instrucciones: {instructions} {'[OK]' if instructions.exists() else '[FAIL]'}")
+        _out.append("\n[INFO] ARCHIVOS GENERADOS:")
+        _out.append(f"[KEY] Llave privada: {pri_key_path} {'[OK]' if pri_ok else '[FAIL]'}")
+        _out.append(f"[CERT] Certificado: {cert_path} {'[OK]' if cert_ok else '[FAIL]'}")
+        _out.append(f"[TXT] Instrucciones: {instructions_path} {'[OK]' if instructions_ok else '[FAIL]'}")
 
-        if pri_key.exists() and cert.exists():
-            print("\n[SUCCESS] CONFIGURACION COMPLETADA EXITOSAMENTE")
-            print("\n[NEXT] PROXIMOS PASOS:")
-            print("1. Lee el archivo ./security/INSTRUCCIONES.txt")
-            print("2. Sube certificate.pem al apihub de Circulo de Credito")
-            print("3. Descarga y guarda el certificado de Circulo como cdc_cert.pem")
-            print("4. Ejecuta: python main.py test_data.json")
+        if pri_ok and cert_ok:
+            _out.append("\n[SUCCESS] CONFIGURACION COMPLETADA EXITOSAMENTE")
+            _out.append("\n[NEXT] PROXIMOS PASOS:")
+            _out.append("1. Lee el archivo ./security/INSTRUCCIONES.txt")
+            _out.append("2. Sube certificate.pem al apihub de Circulo de Credito")
+            _out.append("3. Descarga y guarda el certificado de Circulo como cdc_cert.pem")
+            _out.append("4. Ejecuta: python main.py test_data.json")
+            _flush(_out)
 
-            return True
+            return EXIT_OK
         else:
-            print("\n[ERROR] No se generaron todos los archivos necesarios")
-            return False
+            _out.append("\n[ERROR] No se generaron todos los archivos necesarios")
+            _flush(_out)
+            return EXIT_MISSING_FILES
 
-    except Exception as e:
-        print(f"\n[ERROR] Error durante la configuracion: {e}")
-        return False
+    # Solo se atrapan las fallas esperadas; lo acumulado se emite antes del error
+    except UnsupportedAlgorithm as e:
+        _out.append(f"\n[ERROR] Algoritmo no soportado por OpenSSL: {e}")
+        _flush(_out)
+        return EXIT_CRYPTO_ERROR
+    except OSError as e:
+        _out.append(f"\n[ERROR] Error durante la configuracion: {e}")
+        _flush(_out)
+        return EXIT_IO_ERROR
 
 if __name__ == "__main__":
-    success = main()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Genera llave ECDSA P-384 y certificado para Circulo de Credito")
+    parser.add_argument("--force", action="store_true", help="Regenera llave y certificado aunque ya existan")
+    args = parser.parse_args()
+
+    sys.exit(main(force=args.force))